@@ -0,0 +1,40 @@
+"""Measure parsing throughput with a growing number of threads.
+
+Parsers share no mutable state besides the symbol table, so on a
+free-threaded CPython build throughput should scale with the number
+of threads. With the GIL it stays roughly flat.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sln import Parser
+
+N_DOCUMENTS = 64
+
+text = "\n".join(
+    "package pkg{}\n"
+    "    version \"1.{}\"\n"
+    "    depends (a b c)\n"
+    "    options {{debug = 0; shared = 1;}}".format(i, i)
+    for i in range(200)
+)
+
+def parse(_):
+    return Parser(text).parse()
+
+gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+print("GIL enabled: {}".format(gil))
+
+for n_threads in (1, 2, 4, 8):
+    if n_threads > (os.cpu_count() or 1) * 2:
+        break
+
+    with ThreadPoolExecutor(n_threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(parse, range(N_DOCUMENTS)))
+        elapsed = time.perf_counter() - start
+
+    print("{} threads: {:.1f} documents/s".format(n_threads, N_DOCUMENTS / elapsed))
@@ -0,0 +1,47 @@
+"""Hand a parsed tree to a pool of workers through shared memory.
+
+The tree is parsed once in the parent and flattened into a shared
+memory block. Workers attach to the block in their initializer, which
+costs the same no matter how large the tree is, and only decode the
+nodes they read.
+"""
+
+import multiprocessing
+import time
+
+from sln import Parser
+from sln.shared import SharedTree
+
+_tree = None
+
+def init_worker(name):
+    global _tree
+    _tree = SharedTree.attach(name)
+
+def package_name(index):
+    return _tree.root[index][1].string
+
+if __name__ == "__main__":
+
+    text = "\n".join(
+        "package pkg{}\n"
+        "    version \"1.{}\"\n"
+        "    depends (a b c)".format(i, i)
+        for i in range(20000)
+    )
+
+    tree = Parser(text).parse()
+
+    with SharedTree.create(tree) as shared_tree:
+
+        for n_workers in (1, 2, 4, 8):
+            start = time.perf_counter()
+            with multiprocessing.Pool(
+                    n_workers,
+                    initializer=init_worker,
+                    initargs=(shared_tree.name,),
+            ) as pool:
+                names = pool.map(package_name, range(0, 20000, 1000))
+            elapsed = time.perf_counter() - start
+
+            print("{} workers: {:.3f}s {}".format(n_workers, elapsed, names[:3]))
@@ -1,7 +1,15 @@
-from sln.parser import Parser
+from sln.parser import Parser, Interner, Limits
 from sln.json import parse_to_json
+from sln.convert import Converter, parse_to_python
+from sln.writer import dump, dumps
 
 __all__ = [
     "Parser",
+    "Interner",
+    "Limits",
     "parse_to_json",
+    "Converter",
+    "parse_to_python",
+    "dump",
+    "dumps",
 ]
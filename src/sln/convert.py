@@ -0,0 +1,260 @@
+"""Conversion of parse trees into native Python objects.
+
+The `Converter` walks a tree produced by `Parser.parse` in a single
+pass. Nodes are dispatched on their exact type through a table that
+is compiled once and cached, and tuples whose head is a known symbol
+(e.g. `curly-list`) can be routed to a dedicated form handler.
+
+"""
+
+from collections.abc import Sequence
+from numbers import Number
+from types import MethodType
+
+from sln.parser import (
+    SLNError,
+    Symbol,
+    Symbols,
+    Parser,
+    is_list,
+    symbol,
+)
+
+__all__ = [
+    "Converter",
+    "convert_mapping",
+    "convert_sequence",
+    "parse_to_python",
+]
+
+def _split_bindings(converter, items):
+    """Separate the elements of a container form into bindings and
+    plain values.
+
+    A binding is either three consecutive elements `key = value` (or
+    `key : value`), or a single sublist such as `(key = value ...)`,
+    which is what a `;` separated entry parses to.
+    """
+
+    convert = converter.convert
+    binder = Symbols.DictBinder
+    separator = Symbols.DictSeparator
+    bindings = []
+    values = []
+    i = 0
+    n = len(items)
+    while i < n:
+        item = items[i]
+        if (i + 2) < n and (items[i + 1] is binder
+                            or items[i + 1] is separator):
+            bindings.append((convert(item), convert(items[i + 2])))
+            i += 3
+            continue
+        elif (is_list(item)
+              and len(item) >= 3
+              and (item[1] is binder or item[1] is separator)):
+            if len(item) == 3:
+                value = convert(item[2])
+            else:
+                value = converter.convert_list(item[2:])
+            bindings.append((convert(item[0]), value))
+        else:
+            values.append(convert(item))
+        i += 1
+    return bindings, values
+
+def _build(bindings, values, empty):
+    if bindings and values:
+        raise SLNError("cannot mix bound and unbound elements in a container")
+    elif bindings:
+        result = {}
+        for key, value in bindings:
+            try:
+                result[key] = value
+            except TypeError:
+                raise SLNError("unhashable key in binding: {!r}".format(key))
+        return result
+    elif values:
+        return values
+    else:
+        return empty()
+
+def convert_mapping(converter, node):
+    """Form handler for `{...}`: a dict if it has bindings, an empty
+    dict if it has no elements, and a list otherwise."""
+    bindings, values = _split_bindings(converter, node[1:])
+    return _build(bindings, values, dict)
+
+def convert_sequence(converter, node):
+    """Form handler for `[...]`: a dict if it has bindings, a list
+    otherwise."""
+    bindings, values = _split_bindings(converter, node[1:])
+    return _build(bindings, values, list)
+
+class Converter:
+    """Convert a parse tree into Python objects.
+
+    By default the output matches `Parser.parsed_to_string`: tuples
+    become lists, symbols become strings and strings and numbers are
+    kept as they are.
+
+    Args:
+        containers: If true register the built-in form handlers that
+            turn `curly-list` and `square-list` forms into dicts and
+            lists (see `convert_mapping` and `convert_sequence`).
+
+    Handlers for additional node types are registered with `register`
+    and take `(converter, node)`. Handlers for forms are registered
+    with `register_form` against the symbol at the head of the tuple
+    and take the same arguments.
+
+    """
+
+    def __init__(self, containers=True):
+        self._handlers = {
+            tuple : Converter._convert_tuple,
+            Symbol : Converter._convert_symbol,
+            str : Converter._convert_atom,
+            int : Converter._convert_atom,
+            float : Converter._convert_atom,
+            bool : Converter._convert_atom,
+        }
+        self._forms = {}
+        self._dispatch = None
+        self._atoms = frozenset()
+        self._convert_list = None
+
+        if containers:
+            self.register_form(Symbols.CurlyList, convert_mapping)
+            self.register_form(Symbols.SquareList, convert_sequence)
+
+    def register(self, node_type, handler):
+        """Register a handler for nodes of `node_type` (and subclasses
+        that have no handler of their own)."""
+        self._handlers[node_type] = handler
+        self._dispatch = None
+
+    def register_form(self, head, handler):
+        """Register a handler for tuples whose first element is the
+        symbol `head` (a `Symbol` or its name)."""
+        if isinstance(head, str):
+            head = symbol(head)
+        self._forms[head] = handler
+
+    def _compile(self):
+        # atoms are passed through as they are without a handler call
+        self._atoms = frozenset(
+            node_type
+            for node_type, handler in self._handlers.items()
+            if handler is Converter._convert_atom
+        )
+        self._dispatch = {
+            node_type : MethodType(handler, self)
+            for node_type, handler in self._handlers.items()
+        }
+        self._convert_list = self._compile_list_converter()
+        return self._dispatch
+
+    def _resolve(self, node_type):
+        dispatch = self._dispatch
+        if node_type in dispatch:
+            return dispatch[node_type]
+        for base in node_type.__mro__[1:]:
+            if base in self._handlers:
+                handler = dispatch[base]
+                break
+        else:
+            if issubclass(node_type, Number):
+                handler = MethodType(Converter._convert_atom, self)
+            elif issubclass(node_type, Sequence):
+                # read-only views of lists, e.g. `sln.shared.SharedList`
+                handler = MethodType(Converter._convert_tuple, self)
+            else:
+                raise SLNError("Unknown type in tree encountered")
+        # cache the resolution so the MRO walk only happens once per type
+        dispatch[node_type] = handler
+        return handler
+
+    def convert(self, node):
+        """Convert a single node of the tree."""
+        dispatch = self._dispatch
+        if dispatch is None:
+            dispatch = self._compile()
+        handler = dispatch.get(type(node))
+        if handler is None:
+            handler = self._resolve(type(node))
+        return handler(node)
+
+    def convert_list(self, nodes):
+        """Convert a sequence of nodes into a list."""
+        if self._dispatch is None:
+            self._compile()
+        return self._convert_list(nodes)
+
+    def _compile_list_converter(self):
+        # everything the loop needs is bound in the closure once, so the
+        # recursion into nested lists does no attribute lookups
+        converter = self
+        dispatch = self._dispatch
+        atoms = self._atoms
+        forms = self._forms
+        resolve = self._resolve
+        inline_tuples = self._handlers[tuple] is Converter._convert_tuple
+        inline_symbols = self._handlers[Symbol] is Converter._convert_symbol
+
+        def convert_list(nodes):
+            result = []
+            append = result.append
+            for node in nodes:
+                node_type = type(node)
+                if node_type is tuple and inline_tuples:
+                    head = node[0] if node else None
+                    if type(head) is Symbol and head in forms:
+                        append(forms[head](converter, node))
+                    else:
+                        append(convert_list(node))
+                elif node_type is Symbol and inline_symbols:
+                    append(node.string)
+                elif node_type in atoms:
+                    append(node)
+                else:
+                    handler = dispatch.get(node_type)
+                    if handler is None:
+                        handler = resolve(node_type)
+                    append(handler(node))
+            return result
+
+        return convert_list
+
+    def _convert_tuple(self, node):
+        if node:
+            head = node[0]
+            if type(head) is Symbol:
+                form = self._forms.get(head)
+                if form is not None:
+                    return form(self, node)
+        return self._convert_list(node)
+
+    def _convert_symbol(self, node):
+        return node.string
+
+    def _convert_atom(self, node):
+        return node
+
+def parse_to_python(sln_text, converter=None):
+    """Parse raw sln text straight to Python objects.
+
+    Args:
+        sln_text: The text to parse
+        converter: The `Converter` to use, a default one is used if not
+            given.
+
+    Returns:
+        result: The converted top-level list
+
+    """
+
+    if converter is None:
+        converter = Converter()
+
+    return converter.convert(Parser(sln_text).parse())
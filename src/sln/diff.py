@@ -0,0 +1,185 @@
+"""Structural hashing and diffing of parse trees.
+
+Every node gets a stable digest computed bottom-up from the digests of
+its children (a Merkle tree), so two nodes with the same digest are
+structurally identical and whitespace or comments never change it.
+`diff` uses the digests to skip identical subtrees and only descends
+into the parts of two trees that differ.
+
+"""
+
+import hashlib
+from collections import namedtuple
+from difflib import SequenceMatcher
+
+from sln.parser import (
+    SLNError,
+    Symbol,
+    Parser,
+    is_list,
+)
+
+__all__ = [
+    "TreeHasher",
+    "Change",
+    "diff",
+    "parse_with_hashes",
+]
+
+DIGEST_SIZE = 16
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+class TreeHasher:
+    """Computes and caches the structural digests of tree nodes.
+
+    Pass one to `Parser(text, hasher=...)` to hash every list as it is
+    built, or call `hash` on any node afterwards. Digests are stable
+    across processes and Python versions.
+
+    The hasher keeps a reference to every list it hashed so that the
+    cache, which is keyed by object identity, stays valid. One hasher
+    can be shared by several trees, e.g. the two sides of a `diff`.
+    """
+
+    def __init__(self):
+        self.cache = {}
+
+    def add(self, node):
+        """Hash a list whose children are already hashed, used by the
+        parser as lists are built."""
+        if id(node) not in self.cache:
+            self.cache[id(node)] = (node, self._hash_list(node))
+
+    def _hash_list(self, node):
+        data = [b'(']
+        for child in node:
+            data.append(self.hash(child))
+        return _digest(b''.join(data))
+
+    def hash(self, node):
+        """Return the digest of a node as bytes."""
+        node_type = type(node)
+        if node_type is tuple or node_type is list:
+            entry = self.cache.get(id(node))
+            if entry is not None:
+                return entry[1]
+            digest = self._hash_list(node)
+            self.cache[id(node)] = (node, digest)
+            return digest
+        elif node_type is Symbol:
+            return _digest(b'S' + node.string.encode('utf-8'))
+        elif node_type is str:
+            return _digest(b's' + node.encode('utf-8'))
+        elif node_type is int:
+            return _digest(b'i' + str(node).encode('ascii'))
+        elif node_type is float:
+            return _digest(b'f' + node.hex().encode('ascii'))
+        elif is_list(node):
+            # views such as `SharedList` are new objects on every access,
+            # caching them by identity would only grow the cache
+            return self._hash_list(node)
+        else:
+            raise SLNError("Unknown type in tree encountered")
+
+    def hexdigest(self, node):
+        """Return the digest of a node as a hex string."""
+        return self.hash(node).hex()
+
+def parse_with_hashes(sln_text, hasher=None):
+    """Parse sln text and hash it in the same pass.
+
+    Returns:
+        tree: The parsed tree
+        hasher: The `TreeHasher` holding the digests of its lists
+
+    """
+
+    if hasher is None:
+        hasher = TreeHasher()
+
+    tree = Parser(sln_text, hasher=hasher).parse()
+
+    return tree, hasher
+
+Change = namedtuple("Change", ["kind", "path", "old", "new"])
+Change.__doc__ = """A difference between two trees.
+
+`kind` is one of 'added', 'removed' or 'changed'. `path` is the tuple
+of indices leading to the node, in the new tree for 'added' and
+'changed' and in the old tree for 'removed'. `old` and `new` are the
+nodes on either side, None for the side that does not exist.
+"""
+
+def _diff_lists(hasher, a, b, path_a, path_b, changes):
+    digests_a = [hasher.hash(node) for node in a]
+    digests_b = [hasher.hash(node) for node in b]
+
+    matcher = SequenceMatcher(None, digests_a, digests_b, autojunk=False)
+
+    for op, a_start, a_end, b_start, b_end in matcher.get_opcodes():
+        if op == 'equal':
+            continue
+
+        # pair up replaced nodes, the rest is added or removed
+        n_pairs = 0
+        if op == 'replace':
+            n_pairs = min(a_end - a_start, b_end - b_start)
+
+        for k in range(n_pairs):
+            i = a_start + k
+            j = b_start + k
+            _diff_nodes(hasher, a[i], b[j],
+                        path_a + (i,), path_b + (j,), changes)
+
+        for i in range(a_start + n_pairs, a_end):
+            changes.append(Change('removed', path_a + (i,), a[i], None))
+
+        for j in range(b_start + n_pairs, b_end):
+            changes.append(Change('added', path_b + (j,), None, b[j]))
+
+def _diff_nodes(hasher, a, b, path_a, path_b, changes):
+    if hasher.hash(a) == hasher.hash(b):
+        return
+
+    # descend into lists that are the same kind of form, i.e. that have
+    # the same head, otherwise report the whole node as changed
+    if (is_list(a) and is_list(b)
+        and a and b
+        and hasher.hash(a[0]) == hasher.hash(b[0])):
+        _diff_lists(hasher, a, b, path_a, path_b, changes)
+    else:
+        changes.append(Change('changed', path_b, a, b))
+
+def diff(tree_a, tree_b, hasher=None):
+    """Compute the differences between two trees.
+
+    Subtrees with equal digests are skipped without being visited, so
+    with a hasher that already holds the digests of both trees (see
+    `parse_with_hashes`) the cost depends on the size of the changes
+    and the width of the lists along their paths, not on the size of
+    the trees.
+
+    Args:
+        tree_a: The old tree
+        tree_b: The new tree
+        hasher: A `TreeHasher` to use for both trees, a new one is used
+            if not given.
+
+    Returns:
+        changes: A list of `Change`
+
+    """
+
+    if hasher is None:
+        hasher = TreeHasher()
+
+    changes = []
+
+    if is_list(tree_a) and is_list(tree_b):
+        _diff_lists(hasher, tree_a, tree_b, (), (), changes)
+    else:
+        _diff_nodes(hasher, tree_a, tree_b, (), (), changes)
+
+    return changes
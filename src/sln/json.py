@@ -5,19 +5,32 @@ JSON.
 import argparse
 from pathlib import Path
 import errno
+import hashlib
 import os
 import sys
+import time
 import json
 
-from sln import Parser
+from sln.parser import Parser, Limits, SLNError, SLNLimitError
 
-__all__ = ["parse_to_json"]
+__all__ = [
+    "parse_to_json",
+    "read_sln",
+    "convert_directory",
+    "watch_directory",
+]
 
-def parse_to_json(sln_text: str) -> str:
+MANIFEST_NAME = ".sln-to-json-manifest.json"
+"""Name of the manifest file kept in the output directory."""
+
+MANIFEST_VERSION = 2
+
+def parse_to_json(sln_text: str, limits: Limits = None) -> str:
     """Convert raw sln text to JSON text.
 
     Args:
         sln_text: The text to convert to JSON
+        limits: Optional `Limits` to parse with
 
     Returns:
         json_text: The resulting JSON
@@ -26,43 +39,457 @@ def parse_to_json(sln_text: str) -> str:
 
     return json.dumps(
         Parser(
-            sln_text
+            sln_text,
+            limits=limits,
         ).parse_to_string()
     )
 
+def read_sln(sln_path, limits: Limits = None) -> str:
+    """Read an SLN file, checking its size against `limits` before
+    reading it."""
+
+    sln_path = Path(sln_path)
+
+    if limits is not None:
+        limits.check_input_size(sln_path.stat().st_size)
+
+    return sln_path.read_text()
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as rf:
+        for chunk in iter(lambda: rf.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _limits_key(limits):
+    # the limits a manifest was written with, as stored in it
+    if limits is None:
+        return {}
+    return {
+        name : value
+        for name, value in sorted(vars(limits).items())
+        if value is not None
+    }
+
+def _error_message(err):
+    if isinstance(err, SLNError):
+        return err.msg
+    return str(err)
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r') as rf:
+            manifest = json.load(rf)
+    except (OSError, ValueError):
+        return {}
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+
+    return manifest
+
+def _write_atomic(path, text):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(text)
+    os.replace(tmp_path, path)
+
+def _write_manifest(manifest_path, limits, entries):
+    _write_atomic(
+        manifest_path,
+        json.dumps(
+            {
+                'version' : MANIFEST_VERSION,
+                'limits' : limits,
+                'files' : entries,
+            },
+            indent=1,
+            sort_keys=True,
+        )
+    )
+
+def _remove_output(out_dir, rel_output):
+    out_path = out_dir / rel_output
+    try:
+        out_path.unlink()
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        return
+
+    # prune directories left empty, but never the output root
+    parent = out_path.parent
+    while parent != out_dir:
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+        parent = parent.parent
+
+def convert_directory(
+        sln_dir,
+        out_dir,
+        manifest_path=None,
+        limits=None,
+):
+    """Incrementally convert a tree of SLN files to JSON files.
+
+    Every `*.sln` file under `sln_dir` is converted to a `*.json` file
+    at the same relative path under `out_dir`. A manifest of the
+    inputs' modification times, sizes and content hashes is kept so
+    that only new or modified files are converted on later runs, and
+    outputs whose inputs were removed are deleted. When nothing changed
+    only the inputs are stat'ed. Files that fail to convert are recorded
+    too with their error, keep their previous output and are reported as
+    failed on every run until they change. Everything is reconverted
+    when `limits` differ from the ones of the previous run, and files
+    that ran into the `timeout` are retried on every run.
+
+    Args:
+        sln_dir: The directory to search for SLN files
+        out_dir: The directory to write the JSON files to
+        manifest_path: Where to keep the manifest, defaults to
+            `MANIFEST_NAME` in `out_dir`
+        limits: Optional `Limits` to parse every file with
+
+    Returns:
+        report: A dict of the relative input paths that were
+            'converted', 'removed' and 'unchanged', and of the ones that
+            'failed' mapped to their error message.
+
+    """
+
+    sln_dir = Path(sln_dir)
+    out_dir = Path(out_dir)
+
+    if manifest_path is None:
+        manifest_path = out_dir / MANIFEST_NAME
+    else:
+        manifest_path = Path(manifest_path)
+
+    limits_key = _limits_key(limits)
+    manifest = _read_manifest(manifest_path)
+    old_entries = manifest.get('files', {})
+    # results of other limits can't be reused
+    same_limits = manifest.get('limits') == limits_key
+    entries = {}
+
+    report = {
+        'converted' : [],
+        'removed' : [],
+        'unchanged' : [],
+        'failed' : {},
+    }
+
+    for sln_path in sorted(sln_dir.rglob("*.sln")):
+
+        if not sln_path.is_file():
+            continue
+
+        rel_input = sln_path.relative_to(sln_dir).as_posix()
+        rel_output = Path(rel_input).with_suffix(".json").as_posix()
+
+        # editors often save by deleting and renaming, a file that is
+        # gone by now is handled as removed
+        try:
+            stat = sln_path.stat()
+        except OSError:
+            continue
+
+        old_entry = old_entries.get(rel_input)
+
+        # files that failed to convert have no output to check, they are
+        # retried once their content changes
+        up_to_date = (
+            old_entry is not None
+            and same_limits
+            and not old_entry.get('retry', False)
+            and ('error' in old_entry
+                 or (out_dir / rel_output).exists())
+        )
+
+        # cheap check first, only hash when the stat info differs
+        if (up_to_date
+            and old_entry['mtime_ns'] == stat.st_mtime_ns
+            and old_entry['size'] == stat.st_size):
+
+            entries[rel_input] = old_entry
+            if 'error' in old_entry:
+                report['failed'][rel_input] = old_entry['error']
+            else:
+                report['unchanged'].append(rel_input)
+            continue
+
+        try:
+            digest = _file_digest(sln_path)
+        except OSError:
+            continue
+
+        entry = {
+            'mtime_ns' : stat.st_mtime_ns,
+            'size' : stat.st_size,
+            'sha256' : digest,
+            'output' : rel_output,
+        }
+
+        if up_to_date and old_entry['sha256'] == digest:
+
+            if 'error' in old_entry:
+                entry['error'] = old_entry['error']
+                entry['output'] = old_entry['output']
+                report['failed'][rel_input] = old_entry['error']
+            else:
+                report['unchanged'].append(rel_input)
+
+        else:
+            try:
+                json_text = parse_to_json(
+                    read_sln(sln_path, limits),
+                    limits=limits,
+                )
+            except FileNotFoundError:
+                continue
+            except Exception as err:
+                message = _error_message(err)
+                report['failed'][rel_input] = message
+                # keep the old output around until the input is fixed
+                entry['error'] = message
+                entry['output'] = (
+                    old_entry['output'] if old_entry is not None else None
+                )
+                # running out of time depends on the machine and its
+                # load, not only on the input
+                if (isinstance(err, SLNLimitError)
+                    and err.limit == 'timeout'):
+                    entry['retry'] = True
+                entries[rel_input] = entry
+                continue
+
+            out_path = out_dir / rel_output
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(out_path, json_text)
+
+            report['converted'].append(rel_input)
+
+        entries[rel_input] = entry
+
+    for rel_input, old_entry in old_entries.items():
+        if rel_input in entries:
+            continue
+
+        if old_entry['output'] is not None:
+            _remove_output(out_dir, old_entry['output'])
+        report['removed'].append(rel_input)
+
+    if entries != old_entries or not same_limits:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        _write_manifest(manifest_path, limits_key, entries)
+
+    return report
+
+def watch_directory(
+        sln_dir,
+        out_dir,
+        manifest_path=None,
+        interval=1.0,
+        callback=None,
+        limits=None,
+):
+    """Keep a JSON tree up to date with a tree of SLN files.
+
+    Polls `sln_dir` every `interval` seconds and runs
+    `convert_directory`, which only converts the files that changed
+    since the last poll. Runs until interrupted, or until `callback`
+    raises.
+
+    Args:
+        sln_dir: The directory to search for SLN files
+        out_dir: The directory to write the JSON files to
+        manifest_path: See `convert_directory`
+        interval: Seconds to wait between polls
+        callback: Called with the report of every poll
+        limits: See `convert_directory`
+
+    """
+
+    while True:
+        report = convert_directory(
+            sln_dir,
+            out_dir,
+            manifest_path=manifest_path,
+            limits=limits,
+        )
+
+        if callback is not None:
+            callback(report)
+
+        time.sleep(interval)
+
+def _print_report(report):
+    for rel_input in report['converted']:
+        print("converted: {}".format(rel_input), file=sys.stderr)
+    for rel_input in report['removed']:
+        print("removed: {}".format(rel_input), file=sys.stderr)
+    for rel_input, message in report['failed'].items():
+        print("failed: {}: {}".format(rel_input, message), file=sys.stderr)
+
 class Cli:
 
     def __init__(self):
         self.parser = argparse.ArgumentParser(
-            description="Convert an SLN file to JSON. Outputs to stdout.",
+            description="Convert an SLN file to JSON. Outputs to stdout. "
+            "If given a directory, converts every SLN file in it to a "
+            "JSON file in the output directory, skipping files that did "
+            "not change since the last run.",
         )
 
         self.parser.add_argument(
             "sln_file",
             type=Path,
-            help="The SLN file path to convert",
+            help="The SLN file path to convert, or a directory of them",
+        )
+
+        self.parser.add_argument(
+            "-o", "--output",
+            type=Path,
+            default=None,
+            help="The output directory, required when converting a directory",
+        )
+
+        self.parser.add_argument(
+            "--manifest",
+            type=Path,
+            default=None,
+            help="Path of the manifest file used to skip unchanged files "
+            "(default: {} in the output directory)".format(MANIFEST_NAME),
+        )
+
+        self.parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling the directory and convert files as they change",
+        )
+
+        self.parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds between polls in watch mode (default: 1.0)",
+        )
+
+        limits = self.parser.add_argument_group(
+            "limits",
+            "Resource limits for untrusted input, unlimited by default",
+        )
+
+        limits.add_argument(
+            "--max-depth",
+            type=int,
+            default=None,
+            help="Maximum nesting depth of brackets and indented blocks",
+        )
+
+        limits.add_argument(
+            "--max-nodes",
+            type=int,
+            default=None,
+            help="Maximum number of nodes in a document",
+        )
+
+        limits.add_argument(
+            "--max-atom-length",
+            type=int,
+            default=None,
+            help="Maximum length of a single symbol, number or string",
+        )
+
+        limits.add_argument(
+            "--max-input-bytes",
+            type=int,
+            default=None,
+            help="Maximum size of an input file in bytes",
+        )
+
+        limits.add_argument(
+            "--timeout",
+            type=float,
+            default=None,
+            help="Maximum number of seconds to spend parsing a document",
         )
 
     def parse_args(self):
         args = self.parser.parse_args()
         fpath = Path(args.sln_file)
 
+        if fpath.is_dir():
+            if args.output is None:
+                self.parser.error("--output is required when converting a directory")
+        elif args.watch:
+            self.parser.error("--watch is only supported for directories")
+
         return {
             'sln_file' : fpath,
+            'output' : args.output,
+            'manifest' : args.manifest,
+            'watch' : args.watch,
+            'interval' : args.interval,
+            'limits' : Limits(
+                max_depth=args.max_depth,
+                max_nodes=args.max_nodes,
+                max_atom_length=args.max_atom_length,
+                max_input_bytes=args.max_input_bytes,
+                timeout=args.timeout,
+            ),
         }
 
     def run(self):
 
         args = self.parse_args()
 
-        sln_text = args['sln_file'].read_text()
+        if args['sln_file'].is_dir():
+            return self.run_directory(args)
 
-        json_text = parse_to_json(sln_text)
+        try:
+            sln_text = read_sln(args['sln_file'], args['limits'])
+            json_text = parse_to_json(sln_text, limits=args['limits'])
+        except SLNLimitError as err:
+            print("error: {}".format(err.msg), file=sys.stderr)
+            return 1
 
         sys.stdout.write(json_text)
 
+        return 0
+
+    def run_directory(self, args):
+
+        if args['watch']:
+            try:
+                watch_directory(
+                    args['sln_file'],
+                    args['output'],
+                    manifest_path=args['manifest'],
+                    interval=args['interval'],
+                    callback=_print_report,
+                    limits=args['limits'],
+                )
+            except KeyboardInterrupt:
+                pass
+
+            return 0
+
+        report = convert_directory(
+            args['sln_file'],
+            args['output'],
+            manifest_path=args['manifest'],
+            limits=args['limits'],
+        )
+
+        _print_report(report)
+
+        return 1 if report['failed'] else 0
+
 def cli():
-    Cli().run()
+    sys.exit(Cli().run())
 
 
 if __name__ == "__main__":
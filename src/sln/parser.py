@@ -1,13 +1,25 @@
 """Core Lexer, Parser, and data structures."""
 
+from collections.abc import Sequence
 from numbers import Number
+import sys
+import threading
+import time
 
 def memoize(f):
+    # reads are lock-free, only a miss takes the lock so that concurrent
+    # callers always get back the same object for the same arguments
     memo = {}
+    lock = threading.Lock()
     def helper(*args):
-        if args not in memo:
-            memo[args] = f(*args)
-        return memo[args]
+        try:
+            return memo[args]
+        except KeyError:
+            pass
+        with lock:
+            if args not in memo:
+                memo[args] = f(*args)
+            return memo[args]
     return helper
 
 class SLNError(Exception):
@@ -23,6 +35,69 @@ class SLNError(Exception):
     def append(self, msg):
         self.history.append(msg)
 
+class SLNLimitError(SLNError):
+    """Raised when the input exceeds one of the configured `Limits`.
+
+    The name of the exceeded limit is in `limit`.
+    """
+
+    def __init__(self, msg, limit):
+        super().__init__(msg)
+        self.limit = limit
+
+class Limits:
+    """Resource limits for parsing untrusted input.
+
+    Every limit defaults to None, which means unlimited.
+
+    Args:
+        max_depth: Maximum nesting depth of the parser. Every bracketed
+            list and every line or indented block of the whitespace
+            notation is a level, so `a b` takes one level and `(a b)`
+            two although both parse to the same tree.
+        max_nodes: Maximum number of nodes (atoms and lists) in the tree
+        max_atom_length: Maximum length in characters of a single
+            symbol, number or string as it appears in the source
+        max_input_bytes: Maximum size of the input in UTF-8 bytes
+        timeout: Maximum number of seconds a parse may take
+
+    """
+
+    def __init__(
+            self,
+            max_depth=None,
+            max_nodes=None,
+            max_atom_length=None,
+            max_input_bytes=None,
+            timeout=None,
+    ):
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_atom_length = max_atom_length
+        self.max_input_bytes = max_input_bytes
+        self.timeout = timeout
+
+    def check_input_size(self, size):
+        """Check a size in bytes against `max_input_bytes`."""
+        if self.max_input_bytes is not None and size > self.max_input_bytes:
+            raise SLNLimitError(
+                "input of {} bytes exceeds the limit of {} bytes".format(
+                    size, self.max_input_bytes),
+                'max_input_bytes')
+
+    def check_input(self, text):
+        """Check a text against `max_input_bytes` without encoding it
+        unless its length in characters is not conclusive."""
+        if self.max_input_bytes is None:
+            return
+        if len(text) > self.max_input_bytes:
+            raise SLNLimitError(
+                "input of {} characters exceeds the limit of {} bytes".format(
+                    len(text), self.max_input_bytes),
+                'max_input_bytes')
+        elif len(text) * 4 > self.max_input_bytes:
+            self.check_input_size(len(text.encode('utf-8')))
+
 class Symbol:
     def __init__(self):
         pass
@@ -41,6 +116,15 @@ class Symbol:
 def symbol(str):
     return Symbol.new(str)
 
+def is_list(node):
+    """Whether a node of a tree is a list: a tuple as built by the
+    parser, a list, or another sequence such as a
+    `sln.shared.SharedList` view."""
+    node_type = type(node)
+    return (node_type is tuple
+            or node_type is list
+            or (node_type is not str and isinstance(node, Sequence)))
+
 class Symbols:
     CurlyList = symbol('curly-list')
     SquareList = symbol('square-list')
@@ -76,6 +160,71 @@ real_literal_suffixes = set("f32 f64".strip().split())
 def isspace(c):
     return c in ' \t\n\r'
 
+def try_fmt_split(s):
+    l = s.split(':')
+    if len(l) == 2:
+        return l
+    else:
+        return s,None
+
+def is_integer(s):
+    tail = None
+    if ':' in s:
+        s,tail = try_fmt_split(s)
+    if tail and not (tail in integer_literal_suffixes):
+        return False
+    if not s:
+        return False
+    if s[0] in '+-':
+        s = s[1:]
+    nums = '0123456789'
+    if s.startswith('0x'):
+        nums = nums + 'ABCDEFabcdef'
+        s = s[2:]
+    elif s.startswith('0b'):
+        nums = '01'
+        s = s[2:]
+    elif len(s) > 1 and s[0] == '0':
+        return False
+    if len(s) == 0:
+        return False
+    for k,c in enumerate(s):
+        if not c in nums:
+            return False
+    return True
+
+def is_real(s):
+    tail = None
+    if ':' in s:
+        s,tail = try_fmt_split(s)
+    if tail and not (tail in real_literal_suffixes):
+        return False
+    if not s: return False
+    if s[0] in '+-':
+        s = s[1:]
+    if s == 'inf' or s == 'nan':
+        return True
+    nums = '0123456789'
+    if s.startswith('0x'):
+        nums = nums + 'ABCDEFabcdef'
+        s = s[2:]
+    if len(s) == 0:
+        return False
+    for k,c in enumerate(s):
+        if c == 'e':
+            return is_integer(s[k + 1:])
+        if c == '.':
+            s = s[k + 1:]
+            for k,c in enumerate(s):
+                if c == 'e':
+                    return is_integer(s[k + 1:])
+                if not c in nums:
+                    return False
+            break
+        if not c in nums:
+            return False
+    return True
+
 def parse_hexchar(c):
     if (c >= '0') and (c <= '9'):
         return ord(c) - ord('0')
@@ -110,6 +259,10 @@ def unescape_string (buf):
                 dst += '"'
                 src += 2
                 continue
+            elif c == '\\':
+                dst += '\\'
+                src += 2
+                continue
             elif c == '\n':
                 src += 2
                 # skip until next non whitespace character
@@ -125,14 +278,17 @@ def unescape_string (buf):
                 c1 = parse_hexchar(buf[src+3])
                 if (c0 >= 0) and (c1 >= 0):
                     dst += chr((c0 << 4) | c1)
-                    src += 3
+                    src += 4
                     continue
         dst += c
         src += 1
     return dst
 
 class Lexer:
-    def __init__ (self):
+    def __init__ (self, max_atom_length=None):
+        self.max_atom_length = max_atom_length
+        # set by the parser when it has a time limit
+        self.deadline = None
         self.cursor = 0
         self.next_cursor = 0
         self.lineno = 1
@@ -184,10 +340,11 @@ class Lexer:
         return symbol(self.value)
 
     def get_integer(self):
-        return int(self.value)
+        # the type suffix (e.g. `:i32`) is not kept in the tree
+        return int(self.value.split(':')[0], 0)
 
     def get_real(self):
-        return float(self.value)
+        return float(self.value.split(':')[0])
 
     def tokenize(state, text):
         state.buffer = text
@@ -205,6 +362,15 @@ class Lexer:
         def next():
             x = text[state.next_cursor]
             state.next_cursor = state.next_cursor + 1
+            # long comments, whitespace and atoms are a single token, so
+            # look at the clock every 64K characters while scanning them
+            if ((state.next_cursor & 0xffff) == 0
+                and state.deadline is not None
+                and time.monotonic() > state.deadline):
+                raise SLNLimitError(
+                    "%i:%i: parse exceeded its time limit" % (
+                        state.lineno, state.column()),
+                    'timeout')
             return x
 
         def next_token():
@@ -219,74 +385,19 @@ class Lexer:
         def select_string():
             state.value = text[state.cursor:state.next_cursor]
 
+        def select_atom():
+            # check before slicing so oversized atoms are never copied
+            if ((state.max_atom_length is not None)
+                and (state.next_cursor - state.cursor > state.max_atom_length)):
+                raise SLNLimitError(
+                    "%i:%i: atom exceeds the limit of %i characters" % (
+                        state.lineno, state.column(), state.max_atom_length),
+                    'max_atom_length')
+            select_string()
+
         def reset_cursor():
             state.next_cursor = state.cursor
 
-        def try_fmt_split(s):
-            l = s.split(':')
-            if len(l) == 2:
-                return l
-            else:
-                return s,None
-
-        def is_integer(s):
-            tail = None
-            if ':' in s:
-                s,tail = try_fmt_split(s)
-            if tail and not (tail in integer_literal_suffixes):
-                return False
-            if not s:
-                return False
-            if s[0] in '+-':
-                s = s[1:]
-            nums = '0123456789'
-            if s.startswith('0x'):
-                nums = nums + 'ABCDEFabcdef'
-                s = s[2:]
-            elif s.startswith('0b'):
-                nums = '01'
-                s = s[2:]
-            elif len(s) > 1 and s[0] == '0':
-                return False
-            if len(s) == 0:
-                return False
-            for k,c in enumerate(s):
-                if not c in nums:
-                    return False
-            return True
-
-        def is_real(s):
-            tail = None
-            if ':' in s:
-                s,tail = try_fmt_split(s)
-            if tail and not (tail in real_literal_suffixes):
-                return False
-            if not s: return False
-            if s[0] in '+-':
-                s = s[1:]
-            if s == 'inf' or s == 'nan':
-                return True
-            nums = '0123456789'
-            if s.startswith('0x'):
-                nums = nums + 'ABCDEFabcdef'
-                s = s[2:]
-            if len(s) == 0:
-                return False
-            for k,c in enumerate(s):
-                if c == 'e':
-                    return is_integer(s[k + 1:])
-                if c == '.':
-                    s = s[k + 1:]
-                    for k,c in enumerate(s):
-                        if c == 'e':
-                            return is_integer(s[k + 1:])
-                        if not c in nums:
-                            return False
-                    break
-                if not c in nums:
-                    return False
-            return True
-
         def read_symbol():
             escape = False
             while True:
@@ -302,7 +413,7 @@ class Lexer:
                 elif isspace(c) or (c in TOKEN_TERMINATORS):
                     state.next_cursor = state.next_cursor - 1
                     break
-            select_string()
+            select_atom()
 
         def read_string(terminator):
             escape = False
@@ -323,7 +434,7 @@ class Lexer:
                     escape = True
                 elif c == terminator:
                     break
-            select_string()
+            select_atom()
 
         def read_block(indent):
             col = state.column() + indent
@@ -337,15 +448,16 @@ class Lexer:
                 elif not isspace(c) and (next_col <= col):
                     state.next_cursor = state.next_cursor - 1
                     break
-            select_string()
 
         def read_block_string():
             next()
             next()
             next()
             read_block(3)
+            select_atom()
 
         def read_comment():
+            # the text of comments is never used, so it is not selected
             read_block(0)
 
         def read_whitespace():
@@ -358,7 +470,6 @@ class Lexer:
                 elif not isspace(c):
                     state.next_cursor = state.next_cursor - 1
                     break
-            select_string()
 
         while True:
             next_token()
@@ -386,7 +497,7 @@ class Lexer:
                 token = Token.SquareOpen
                 select_string()
             elif c == ']':
-                token = TokenSquareClose
+                token = Token.SquareClose
                 select_string()
             elif c == '{':
                 token = Token.CurlyOpen
@@ -426,10 +537,93 @@ class Lexer:
                     token = Token.Symbol
             yield token
 
+class Interner:
+    """Hash-conses the nodes of parse trees.
+
+    Structurally identical subtrees (and equal strings and numbers) are
+    replaced by one shared object, so repeated forms cost their memory
+    only once and `a is b` can be used as a cheap equality check on
+    interned nodes. An interner can be shared by several parsers to
+    deduplicate across documents.
+
+    Tuples are keyed by the identity of their (already interned)
+    children, so interning a node is proportional to its length and not
+    to the size of its subtree. Numbers are keyed with their type and
+    floats by their exact value, so 1, 1.0 and -0.0, 0.0 stay distinct.
+    """
+
+    def __init__(self):
+        self.table = {}
+        self.lookups = 0
+        self.hits = 0
+        self.bytes_saved = 0
+
+    def intern(self, node):
+        node_type = type(node)
+        if node_type is tuple:
+            key = []
+            for child in node:
+                child_type = type(child)
+                if child_type is tuple or child_type is Symbol:
+                    key.append(id(child))
+                elif child_type is str:
+                    key.append(child)
+                elif child_type is float:
+                    key.append((child_type, child.hex()))
+                else:
+                    key.append((child_type, child))
+            key = tuple(key)
+        elif node_type is str:
+            key = node
+        elif node_type is float:
+            # keyed by the exact value, 0.0 == -0.0 must not merge
+            key = (node_type, node.hex())
+        else:
+            key = (node_type, node)
+
+        self.lookups += 1
+        shared = self.table.get(key)
+        if shared is None:
+            shared = self.table.setdefault(key, node)
+            if shared is node:
+                return node
+        self.hits += 1
+        if shared is not node:
+            self.bytes_saved += sys.getsizeof(node)
+        return shared
+
+    def stats(self):
+        """Return the deduplication statistics.
+
+        Returns:
+            stats: A dict with the number of interned 'nodes', how many
+                of them are 'unique', how many were replaced by a
+                'shared' node and the shallow size of the replaced nodes
+                in 'bytes_saved'.
+
+        """
+
+        return {
+            'nodes' : self.lookups,
+            'unique' : len(self.table),
+            'shared' : self.hits,
+            'bytes_saved' : self.bytes_saved,
+        }
+
 class ListBuilder:
-    def __init__ (self):
+    def __init__ (self, interner=None, hasher=None):
         self.prev = []
         self.eol = 0
+        self.interner = interner
+        self.hasher = hasher
+
+    def make_list(self, values):
+        result = tuple(values)
+        if self.interner is not None:
+            result = self.interner.intern(result)
+        if self.hasher is not None:
+            self.hasher.add(result)
+        return result
 
     def append (self, value):
         self.prev.append(value)
@@ -441,17 +635,12 @@ class ListBuilder:
         self.eol = len(self.prev)
 
     def split(self, anchor):
-        self.prev = [tuple(self.prev[:self.eol])]
+        # wrap everything since the last split point into a sublist
+        self.prev[self.eol:] = [self.make_list(self.prev[self.eol:])]
         self.reset_start()
 
     def get_result(self):
-        return tuple(self.prev)
-
-_active_anchor = None
-def trace(anchor):
-    global _active_anchor
-    _active_anchor = anchor
-
+        return self.make_list(self.prev)
 
 def error(msg, *args):
     raise SLNError(msg.format(*args))
@@ -460,23 +649,89 @@ def tag(anchor, obj):
     return obj
 
 class Parser:
-    def __init__(self, text):
-        self.state = Lexer()
+    """Parser for SLN text.
+
+    Args:
+        text: The SLN text to parse
+        interner: An optional `Interner` to hash-cons the resulting tree
+            with, so that identical subtrees are shared.
+        limits: Optional `Limits` for parsing untrusted input. Exceeding
+            one raises `SLNLimitError`.
+        hasher: An optional `sln.diff.TreeHasher` that computes the
+            structural hash of every list as it is built.
+
+    """
+
+    def __init__(self, text, interner=None, limits=None, hasher=None):
+        if limits is None:
+            limits = Limits()
+        limits.check_input(text)
+
+        self.state = Lexer(limits.max_atom_length)
         self.tokenizer = self.state.tokenize(text)
+        self.active_anchor = None
+        self.interner = interner
+        self.hasher = hasher
+        self.limits = limits
+        self.depth = 0
+        self.nodes = 0
+        self.tokens = 0
+        self.deadline = None
 
     def anchor (self):
         pass
 
     def read_token (self):
         self.token = next(self.tokenizer)
+        if self.deadline is not None:
+            self.tokens += 1
+            # only look at the clock every 1024 tokens
+            if ((self.tokens & 0x3ff) == 0
+                and time.monotonic() > self.deadline):
+                raise SLNLimitError(
+                    "parse exceeded the time limit of {} seconds".format(
+                        self.limits.timeout),
+                    'timeout')
+
+    def enter (self):
+        self.depth += 1
+        if (self.limits.max_depth is not None
+            and self.depth > self.limits.max_depth):
+            raise SLNLimitError(
+                "{}:{}: nesting exceeds the limit of {} levels".format(
+                    self.state.lineno, self.state.column(),
+                    self.limits.max_depth),
+                'max_depth')
+
+    def leave (self):
+        self.depth -= 1
+
+    def add_node (self):
+        self.nodes += 1
+        if (self.limits.max_nodes is not None
+            and self.nodes > self.limits.max_nodes):
+            raise SLNLimitError(
+                "{}:{}: input exceeds the limit of {} nodes".format(
+                    self.state.lineno, self.state.column(),
+                    self.limits.max_nodes),
+                'max_nodes')
 
     def trace (self, anchor):
-        pass
+        self.active_anchor = anchor
+
+    def intern (self, value):
+        if self.interner is None:
+            return value
+        return self.interner.intern(value)
 
     # parses a list to its terminator and returns a handle to the first cell
-    def parse_list (self, end_token):
+    def parse_list (self, end_token, head=None):
         start_anchor = self.anchor()
-        builder = ListBuilder()
+        self.enter()
+        builder = ListBuilder(self.interner, self.hasher)
+        if head is not None:
+            builder.append(head)
+            builder.reset_start()
         self.read_token()
         while True:
             token = self.token
@@ -487,43 +742,47 @@ class Parser:
                 self.read_token()
                 builder.append(self.parse_naked(column, end_token))
             elif token == Token.EOF:
-                trace(self.anchor())
+                self.trace(self.anchor())
                 error("format: parenthesis never closed\n{} opened here", start_anchor)
             elif token == Token.Separator:
+                # the split wraps the elements so far into a new list
+                self.add_node()
                 builder.split(self.anchor())
                 self.read_token()
             else:
                 builder.append(self.parse_any())
                 self.read_token()
+        self.leave()
         return builder.get_result()
 
     # parses the next sequence and returns it wrapped in a cell that points to prev
     def parse_any(self):
         assert self.token != Token.EOF
+        self.add_node()
         anchor = self.anchor()
         if self.token == Token.Open:
             return tag(anchor, self.parse_list(Token.Close))
         elif self.token == Token.SquareOpen:
-            return tag(anchor, [tag(anchor, Symbols.SquareList)] +
-                    self.parse_list(Token.SquareClose))
+            return tag(anchor, self.parse_list(Token.SquareClose,
+                    tag(anchor, Symbols.SquareList)))
         elif self.token == Token.CurlyOpen:
-            return tag(anchor, [tag(anchor, Symbols.CurlyList)] +
-                    self.parse_list(Token.CurlyClose))
+            return tag(anchor, self.parse_list(Token.CurlyClose,
+                    tag(anchor, Symbols.CurlyList)))
         elif self.token in (Token.Close, Token.SquareClose, Token.CurlyClose):
-            trace(self.anchor())
+            self.trace(self.anchor())
             error("format: stray closing bracket")
         elif self.token == Token.String:
-            return tag(anchor, self.state.get_string())
+            return tag(anchor, self.intern(self.state.get_string()))
         elif self.token == Token.BlockString:
-            return tag(anchor, self.state.get_block_string())
+            return tag(anchor, self.intern(self.state.get_block_string()))
         elif self.token == Token.Symbol:
             return tag(anchor, self.state.get_symbol())
         elif self.token == Token.Integer:
-            return tag(anchor, self.state.get_integer())
+            return tag(anchor, self.intern(self.state.get_integer()))
         elif self.token == Token.Real:
-            return tag(anchor, self.state.get_real())
+            return tag(anchor, self.intern(self.state.get_real()))
         else:
-            trace(anchor)
+            self.trace(anchor)
             error("format: unexpected token '{}' ({})",
                 self.state.buffer[self.state.cursor],
                 ord(self.state.buffer[self.state.cursor]))
@@ -534,7 +793,8 @@ class Parser:
         subcolumn = 0
 
         anchor = self.anchor()
-        builder = ListBuilder()
+        self.enter()
+        builder = ListBuilder(self.interner, self.hasher)
 
         unwrap_single = True
         while self.token != Token.EOF:
@@ -544,18 +804,18 @@ class Parser:
                 escape = True
                 self.read_token()
                 if self.state.lineno <= lineno:
-                    trace(self.anchor())
+                    self.trace(self.anchor())
                     error("format: list continuation character must be at beginning or end of sublist line")
                 lineno = self.lineno
             elif self.state.lineno > lineno:
                 if subcolumn == 0:
                     subcolumn = self.state.column()
                 elif self.state.column() != subcolumn:
-                    trace(self.anchor())
+                    self.trace(self.anchor())
                     error("format: indentation mismatch")
                 elif column != subcolumn:
                     if (column + 4) != subcolumn:
-                        trace(self.anchor())
+                        self.trace(self.anchor())
                         error("format: indentations must nest by 4 spaces")
 
                 escape = False
@@ -578,18 +838,22 @@ class Parser:
                 and (self.state.column() <= column)):
                 break
 
-        result = builder.get_result()
-        if unwrap_single and result and len(result) == 1:
-            return result[0]
+        self.leave()
+        if unwrap_single and len(builder.prev) == 1:
+            return builder.prev[0]
         else:
-            return tag(anchor, result)
+            self.add_node()
+            return tag(anchor, builder.get_result())
 
     def parse(self):
+        if self.limits.timeout is not None:
+            self.deadline = time.monotonic() + self.limits.timeout
+            self.state.deadline = self.deadline
         self.read_token()
         lineno = 0
 
         anchor = self.anchor()
-        builder = ListBuilder()
+        builder = ListBuilder(self.interner, self.hasher)
 
         while self.token != Token.EOF:
             if self.token == Token.Empty:
@@ -597,12 +861,12 @@ class Parser:
             elif self.token == Token.Escape:
                 self.read_token()
                 if self.lineno <= lineno:
-                    trace(self.anchor())
+                    self.trace(self.anchor())
                     error("format: list continuation character must be at beginning or end of sublist line")
                 lineno = self.lineno
             elif self.state.lineno > lineno:
                 if self.state.column() != 1:
-                    trace(self.anchor())
+                    self.trace(self.anchor())
                     error("format: indentation mismatch")
                 lineno = self.state.lineno
                 # keep adding elements while we're in the same line
@@ -611,7 +875,7 @@ class Parser:
                         and (self.state.lineno == lineno)):
                     builder.append(self.parse_naked(1, Token.Empty))
             elif self.token == Token.Separator:
-                trace(self.anchor())
+                self.trace(self.anchor())
                 error("format: unexpected list separation character")
             else:
                 builder.append(self.parse_any())
@@ -0,0 +1,337 @@
+"""Sharing parsed trees between processes through shared memory.
+
+`SharedTree.create` flattens a tree into a single
+`multiprocessing.shared_memory` block, and `SharedTree.attach` maps
+that block in another process and gives read-only, tree-like access to
+it without copying or unpickling the whole tree. Only the atoms that
+are actually read are turned into Python objects.
+
+Requires Python 3.8 or newer.
+
+Layout of the block (native byte order)::
+
+    header
+    kinds     uint8[n_nodes]     node kind
+    values    int64[n_nodes]     list: first child, atom: blob offset,
+                                 int: value, float: value (as double)
+    sizes     int64[n_nodes]     list: number of children,
+                                 atom: length in the blob
+    children  int64[n_children]  node indices of the list elements
+    blob      bytes[blob_size]   UTF-8 text of symbols and strings
+
+"""
+
+from array import array
+from collections.abc import Sequence
+import struct
+from multiprocessing import shared_memory
+
+from sln.parser import (
+    SLNError,
+    Symbol,
+    symbol,
+)
+
+__all__ = [
+    "SharedTree",
+    "SharedList",
+]
+
+MAGIC = b"SLNSHM\0\0"
+VERSION = 1
+
+HEADER = struct.Struct("=8sIIqqqq")
+"""magic, version, reserved, n_nodes, n_children, blob_size, root"""
+
+LIST = 0
+SYMBOL = 1
+STRING = 2
+INT = 3
+FLOAT = 4
+BIGINT = 5
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _layout(n_nodes, n_children, blob_size):
+    kinds = HEADER.size
+    values = _align(kinds + n_nodes)
+    sizes = values + 8 * n_nodes
+    children = sizes + 8 * n_nodes
+    blob = children + 8 * n_children
+    return kinds, values, sizes, children, blob, blob + blob_size
+
+class _Flattener:
+    """Flattens a tree into the arrays of the shared layout.
+
+    Lists that are the same object (e.g. from an `Interner`) and equal
+    symbols and strings are only stored once.
+    """
+
+    def __init__(self):
+        self.kinds = bytearray()
+        self.values = array('q')
+        self.sizes = array('q')
+        self.children = array('q')
+        self.blob = bytearray()
+        self.lists = {}
+        self.texts = {}
+        # keep the flattened lists alive so their ids stay unique
+        self.refs = []
+
+    def add_text(self, text):
+        entry = self.texts.get(text)
+        if entry is None:
+            data = text.encode('utf-8')
+            entry = (len(self.blob), len(data))
+            self.blob += data
+            self.texts[text] = entry
+        return entry
+
+    def add_node(self, kind, value, size):
+        self.kinds.append(kind)
+        self.values.append(value)
+        self.sizes.append(size)
+        return len(self.kinds) - 1
+
+    def add(self, node):
+        node_type = type(node)
+        if node_type is tuple or node_type is list:
+            index = self.lists.get(id(node))
+            if index is not None:
+                return index
+
+            start = len(self.children)
+            self.children.extend([0] * len(node))
+            index = self.add_node(LIST, start, len(node))
+            self.lists[id(node)] = index
+            self.refs.append(node)
+
+            for k, child in enumerate(node):
+                self.children[start + k] = self.add(child)
+
+            return index
+
+        elif node_type is Symbol:
+            return self.add_node(SYMBOL, *self.add_text(node.string))
+        elif node_type is str:
+            return self.add_node(STRING, *self.add_text(node))
+        elif node_type is int:
+            if INT64_MIN <= node <= INT64_MAX:
+                return self.add_node(INT, node, 0)
+            return self.add_node(BIGINT, *self.add_text(str(node)))
+        elif node_type is float:
+            bits, = struct.unpack("=q", struct.pack("=d", node))
+            return self.add_node(FLOAT, bits, 0)
+        else:
+            raise SLNError("Unknown type in tree encountered")
+
+class SharedList(Sequence):
+    """Read-only view of a list stored in a `SharedTree`.
+
+    Behaves like a tuple: supports `len`, indexing, slicing, iteration
+    and comparison with tuples. Elements that are lists are returned as
+    `SharedList` views, atoms as `Symbol`, `str`, `int` or `float`. The
+    `Converter`, `dump` and `diff` accept views in place of tuples.
+    """
+
+    __slots__ = ("_tree", "_start", "_size")
+
+    def __init__(self, tree, start, size):
+        self._tree = tree
+        self._start = start
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(self._size)))
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("SharedList index out of range")
+        tree = self._tree
+        return tree._node(tree._children[self._start + index])
+
+    def __iter__(self):
+        tree = self._tree
+        children = tree._children
+        for i in range(self._start, self._start + self._size):
+            yield tree._node(children[i])
+
+    def __eq__(self, other):
+        if isinstance(other, str) or not isinstance(other, Sequence):
+            return NotImplemented
+        if len(other) != self._size:
+            return False
+        for a, b in zip(self, other):
+            if not a == b:
+                return False
+        return True
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "SharedList({!r})".format(self.to_tuple())
+
+    def to_tuple(self):
+        """Copy the list and everything in it into a regular tree of
+        tuples, as returned by `Parser.parse`."""
+        return tuple(
+            element.to_tuple() if type(element) is SharedList else element
+            for element in self
+        )
+
+class SharedTree:
+    """A parsed tree stored in a shared memory block.
+
+    Create one in the parent process with `SharedTree.create`, pass its
+    `name` to the workers and open it there with `SharedTree.attach`.
+    Every process must `close` it when done, and the creator must also
+    `unlink` it. Both are done on leaving a `with` block.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+
+        buf = shm.buf
+        magic, version, _, n_nodes, n_children, blob_size, root = \
+            HEADER.unpack_from(buf)
+
+        if magic != MAGIC or version != VERSION:
+            raise SLNError("shared memory block does not hold an SLN tree")
+
+        kinds, values, sizes, children, blob, end = \
+            _layout(n_nodes, n_children, blob_size)
+
+        buf = buf.toreadonly()
+        self._kinds = buf[kinds:kinds + n_nodes]
+        self._values = buf[values:sizes].cast('q')
+        self._reals = buf[values:sizes].cast('d')
+        self._sizes = buf[sizes:children].cast('q')
+        self._children = buf[children:blob].cast('q')
+        self._blob = buf[blob:end]
+        self._root = root
+
+    @classmethod
+    def create(cls, tree, name=None):
+        """Flatten a tree into a new shared memory block.
+
+        Args:
+            tree: The tree to share, as returned by `Parser.parse`
+            name: Optional name of the block, a unique one is generated
+                if not given.
+
+        Returns:
+            shared_tree: The `SharedTree` owning the new block
+
+        """
+
+        flat = _Flattener()
+        root = flat.add(tree)
+
+        n_nodes = len(flat.kinds)
+        n_children = len(flat.children)
+        blob_size = len(flat.blob)
+
+        kinds, values, sizes, children, blob, end = \
+            _layout(n_nodes, n_children, blob_size)
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(end, 1))
+        try:
+            buf = shm.buf
+            HEADER.pack_into(buf, 0, MAGIC, VERSION, 0,
+                             n_nodes, n_children, blob_size, root)
+            buf[kinds:kinds + n_nodes] = flat.kinds
+            buf[values:sizes] = memoryview(flat.values).cast('B')
+            buf[sizes:children] = memoryview(flat.sizes).cast('B')
+            buf[children:blob] = memoryview(flat.children).cast('B')
+            buf[blob:end] = flat.blob
+            del buf
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Open a tree shared by another process.
+
+        Args:
+            name: The `name` of the shared tree
+
+        Returns:
+            shared_tree: A read-only `SharedTree`
+
+        """
+
+        try:
+            # the creator is responsible for the block, don't let this
+            # process' resource tracker unlink it on exit
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def root(self):
+        """The top-level node, usually a `SharedList` of forms."""
+        return self._node(self._root)
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def _text(self, index):
+        offset = self._values[index]
+        return str(self._blob[offset:offset + self._sizes[index]], 'utf-8')
+
+    def _node(self, index):
+        kind = self._kinds[index]
+        if kind == LIST:
+            return SharedList(self, self._values[index], self._sizes[index])
+        elif kind == SYMBOL:
+            return symbol(self._text(index))
+        elif kind == STRING:
+            return self._text(index)
+        elif kind == INT:
+            return self._values[index]
+        elif kind == FLOAT:
+            return self._reals[index]
+        elif kind == BIGINT:
+            return int(self._text(index))
+        else:
+            raise SLNError("corrupt shared tree: unknown node kind {}".format(kind))
+
+    def close(self):
+        """Release this process' views of the block."""
+        for view in (self._kinds, self._values, self._reals,
+                     self._sizes, self._children, self._blob):
+            view.release()
+        self.shm.close()
+
+    def unlink(self):
+        """Free the block, only allowed for the creator."""
+        if not self.owner:
+            raise SLNError("only the creator of a shared tree can unlink it")
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        if self.owner:
+            self.unlink()
@@ -0,0 +1,219 @@
+"""Serializing trees back to SLN text.
+
+`dump` and `dumps` are the inverse of `Parser.parse`: tuples (or
+lists) become lists, `Symbol` objects are written bare and strings are
+quoted and escaped so that `unescape_string` gives them back. Output is
+written to the file object in chunks so large trees are never turned
+into one big string.
+
+"""
+
+import io
+import math
+
+from sln.parser import (
+    SLNError,
+    Symbol,
+    Symbols,
+    TOKEN_TERMINATORS,
+    isspace,
+    is_integer,
+    is_list,
+    is_real,
+)
+
+__all__ = [
+    "dump",
+    "dumps",
+    "escape_string",
+]
+
+STYLES = ("paren", "indent")
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+INDENT = "    "
+
+_ESCAPES = {
+    '\n' : '\\n',
+    '\t' : '\\t',
+    '\r' : '\\r',
+    '"' : '\\"',
+    '\\' : '\\\\',
+}
+
+def escape_string(text):
+    """Quote and escape a string, the inverse of `unescape_string`."""
+    parts = ['"']
+    for c in text:
+        escaped = _ESCAPES.get(c)
+        if escaped is not None:
+            parts.append(escaped)
+        elif c < ' ' or c == '\x7f':
+            parts.append("\\x{:02x}".format(ord(c)))
+        else:
+            parts.append(c)
+    parts.append('"')
+    return "".join(parts)
+
+def _is_symbol_text(text):
+    # `,` is a symbol on its own and `'` may start a quoted symbol, every
+    # other terminator, whitespace or escape would end or split it
+    if text == ',':
+        return True
+    quoted = text.startswith("'")
+    for c in text[1:] if quoted else text:
+        if isspace(c) or c in TOKEN_TERMINATORS or c == '\\':
+            return False
+    # a quoted symbol is never read as a number
+    return quoted or not (is_integer(text) or is_real(text))
+
+def _format_symbol(node):
+    text = node.string
+    if not text or not _is_symbol_text(text):
+        raise SLNError("symbol cannot be written: {!r}".format(text))
+    return text
+
+def _format_real(node):
+    if math.isnan(node):
+        return "nan"
+    elif math.isinf(node):
+        return "inf" if node > 0 else "-inf"
+    text = repr(node)
+    if 'e' in text:
+        # the lexer does not accept zero padded or `+` signed exponents
+        mantissa, exponent = text.split('e')
+        text = "{}e{}".format(mantissa, int(exponent))
+    return text
+
+class _ChunkWriter:
+    """Collects output pieces and writes them out in chunks."""
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.pieces = []
+        self.size = 0
+
+    def write(self, piece):
+        self.pieces.append(piece)
+        self.size += len(piece)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.pieces:
+            self.fp.write("".join(self.pieces))
+            self.pieces = []
+            self.size = 0
+
+def _brackets(node):
+    if node:
+        head = node[0]
+        if head is Symbols.CurlyList:
+            return '{', '}', node[1:]
+        elif head is Symbols.SquareList:
+            return '[', ']', node[1:]
+    return '(', ')', node
+
+def _format_atom(node):
+    node_type = type(node)
+    if node_type is Symbol:
+        return _format_symbol(node)
+    elif node_type is str:
+        return escape_string(node)
+    elif node_type is int:
+        return str(node)
+    elif node_type is float:
+        return _format_real(node)
+    else:
+        raise SLNError("Unknown type in tree encountered")
+
+def _write_paren(out, node):
+    if not is_list(node):
+        out.write(_format_atom(node))
+        return
+
+    open_bracket, close_bracket, elements = _brackets(node)
+    out.write(open_bracket)
+    first = True
+    for element in elements:
+        if not first:
+            out.write(' ')
+        first = False
+        _write_paren(out, element)
+    out.write(close_bracket)
+
+def _write_indent(out, node, depth):
+    """Write `node` as the naked list starting at the current line,
+    indented by `depth` levels. Returns with the line unterminated."""
+
+    # lists that can't be written naked are written inline: bracketed
+    # forms, and lists of fewer than two elements (which would unwrap)
+    if (not is_list(node)
+        or len(node) < 2
+        or _brackets(node)[0] != '('):
+        _write_paren(out, node)
+        return
+
+    # the head line holds the leading atoms, or a single leading list
+    if is_list(node[0]):
+        _write_paren(out, node[0])
+        start = 1
+    else:
+        start = 0
+        while start < len(node) and not is_list(node[start]):
+            if start > 0:
+                out.write(' ')
+            out.write(_format_atom(node[start]))
+            start += 1
+
+    indent = INDENT * (depth + 1)
+    for element in node[start:]:
+        out.write('\n')
+        out.write(indent)
+        _write_indent(out, element, depth + 1)
+
+def dump(tree, fp, style="paren", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write a parsed tree as SLN text to a file object.
+
+    Args:
+        tree: The top-level tuple of forms, as returned by `Parser.parse`
+        fp: A text file object to write to
+        style: "paren" writes every form on one line with parentheses,
+            "indent" uses the whitespace sensitive notation
+        chunk_size: Roughly how many characters to collect before each
+            write to `fp`
+
+    """
+
+    if style not in STYLES:
+        raise ValueError("style must be one of {}".format(", ".join(STYLES)))
+
+    if not is_list(tree):
+        raise SLNError("the top-level of a tree must be a list of forms")
+
+    out = _ChunkWriter(fp, chunk_size)
+
+    for form in tree:
+        if style == "paren":
+            _write_paren(out, form)
+        else:
+            _write_indent(out, form, 0)
+        out.write('\n')
+
+    out.flush()
+
+def dumps(tree, style="paren"):
+    """Serialize a parsed tree to SLN text.
+
+    See `dump` for the arguments.
+
+    Returns:
+        sln_text: The resulting SLN text
+
+    """
+
+    fp = io.StringIO()
+    dump(tree, fp, style=style)
+    return fp.getvalue()
@@ -0,0 +1,94 @@
+
+import pytest
+
+from sln import Parser, Converter, parse_to_python
+from sln.parser import SLNError, Symbol
+
+def test_matches_parse_to_string():
+
+    cases = (
+        """""",
+        """single""",
+        """(list (is one))""",
+        """list is 1""",
+        """1.0""",
+        """
+list
+    is
+        one two
+            """,
+    )
+
+    converter = Converter(containers=False)
+    for input in cases:
+
+        assert (converter.convert(Parser(input).parse()) ==
+                Parser(input).parse_to_string())
+
+def test_containers():
+
+    cases = (
+        ("""{}""", [{}]),
+        ("""[]""", [[]]),
+        ("""[1 2 3]""", [[1, 2, 3]]),
+        ("""{a b}""", [['a', 'b']]),
+        ("""{a = 1}""", [{'a': 1}]),
+        ("""{a = 1 b : "two"}""", [{'a': 1, 'b': 'two'}]),
+        ("""{a = 1; b = 2;}""", [{'a': 1, 'b': 2}]),
+        ("""{a = 1 2;}""", [{'a': [1, 2]}]),
+        ("""[a = [1 2] b = {c = 3}]""", [{'a': [1, 2], 'b': {'c': 3}}]),
+        (
+            """
+package foo
+    version 1.0
+    options {debug = 0; shared = 1;}
+            """,
+            [['package', 'foo',
+              ['version', 1.0],
+              ['options', {'debug': 0, 'shared': 1}]]]
+        ),
+    )
+
+    for input, expected in cases:
+
+        assert parse_to_python(input) == expected
+
+def test_containers_disabled():
+
+    assert parse_to_python("{a = 1}", Converter(containers=False)) == \
+        [['curly-list', 'a', '=', 1]]
+
+def test_mixed_container_error():
+
+    with pytest.raises(SLNError):
+        parse_to_python("{a = 1 b}")
+
+def test_register_form():
+
+    converter = Converter()
+    converter.register_form(
+        'set',
+        lambda converter, node: set(converter.convert_list(node[1:])),
+    )
+
+    assert parse_to_python("(set a b a)", converter) == [{'a', 'b'}]
+
+def test_register_type():
+
+    converter = Converter()
+    converter.register(float, lambda converter, node: str(node))
+
+    assert parse_to_python("1 2.5", converter) == [[1, '2.5']]
+
+def test_unknown_type():
+
+    with pytest.raises(SLNError):
+        Converter().convert((object(),))
+
+def test_register_inlined_types():
+
+    converter = Converter()
+    converter.register(tuple, lambda converter, node: tuple(converter.convert_list(node)))
+    converter.register(Symbol, lambda converter, node: node.string.upper())
+
+    assert parse_to_python("a (b c)", converter) == (('A', ('B', 'C')),)
@@ -0,0 +1,86 @@
+
+from sln import Parser
+from sln.diff import TreeHasher, diff, parse_with_hashes
+
+OLD = """
+package foo
+    version "1.0"
+    depends (a b)
+package bar
+    version "2.0"
+package baz
+    version "3.0"
+"""
+
+NEW = """
+# a comment does not change anything
+package foo
+    version "1.0"
+    depends (a b c)
+package baz
+    version   "3.0"
+package qux
+    version "1.0"
+"""
+
+def test_hash_ignores_formatting():
+
+    a = Parser("(list is (one two))").parse()
+    b = Parser("""
+# comment
+list   is
+    one two
+""").parse()
+
+    hasher = TreeHasher()
+    assert hasher.hash(a) == hasher.hash(b)
+    assert hasher.hexdigest(a) == TreeHasher().hexdigest(b)
+
+def test_hash_distinguishes_types():
+
+    hasher = TreeHasher()
+    digests = {
+        hasher.hash(node)
+        for node in Parser('1 1.0 "1" one "one" (one) ((one))').parse()[0]
+    }
+    assert len(digests) == 7
+
+def test_parse_with_hashes():
+
+    hasher = TreeHasher()
+    tree, _ = parse_with_hashes(OLD, hasher)
+
+    # every list was hashed while parsing
+    assert id(tree) in hasher.cache
+    assert id(tree[0][2]) in hasher.cache
+    assert hasher.hash(tree) == TreeHasher().hash(Parser(OLD).parse())
+
+def test_diff():
+
+    hasher = TreeHasher()
+    old, _ = parse_with_hashes(OLD, hasher)
+    new, _ = parse_with_hashes(NEW, hasher)
+
+    changes = [
+        (change.kind, change.path,
+         Parser.parsed_to_string(change.old) if change.old is not None else None,
+         Parser.parsed_to_string(change.new) if change.new is not None else None)
+        for change in diff(old, new, hasher)
+    ]
+
+    assert changes == [
+        ('added', (0, 3, 1, 2), None, 'c'),
+        ('removed', (1,), ['package', 'bar', ['version', '2.0']], None),
+        ('added', (2,), None, ['package', 'qux', ['version', '1.0']]),
+    ]
+
+def test_diff_changed():
+
+    changes = diff(Parser("a 1; b 2").parse(), Parser("a 1; b 3").parse())
+
+    assert [(change.kind, change.path) for change in changes] == \
+        [('changed', (1, 1))]
+
+def test_diff_identical():
+
+    assert diff(Parser(OLD).parse(), Parser(OLD).parse()) == []
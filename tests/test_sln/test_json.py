@@ -0,0 +1,224 @@
+
+import json
+import os
+import sys
+
+import pytest
+
+import sln.json
+from sln import Limits, parse_to_json
+from sln.json import Cli, convert_directory, watch_directory, MANIFEST_NAME
+
+def test_parse_to_json():
+
+    assert json.loads(parse_to_json("list is 1")) == [['list', 'is', 1]]
+
+def _touch(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    # make sure the modification is visible even on coarse mtimes
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+def test_convert_directory(tmp_path):
+
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+
+    _touch(src / "a.sln", "a 1")
+    _touch(src / "sub" / "b.sln", "b 2")
+
+    report = convert_directory(src, out)
+    assert sorted(report['converted']) == ["a.sln", "sub/b.sln"]
+    assert json.loads((out / "a.json").read_text()) == [['a', 1]]
+    assert json.loads((out / "sub" / "b.json").read_text()) == [['b', 2]]
+    assert (out / MANIFEST_NAME).exists()
+
+    # nothing changed
+    report = convert_directory(src, out)
+    assert report['converted'] == []
+    assert sorted(report['unchanged']) == ["a.sln", "sub/b.sln"]
+
+    # touched but same content is not reconverted
+    _touch(src / "a.sln", "a 1")
+    report = convert_directory(src, out)
+    assert report['converted'] == []
+
+    # modified and added files
+    _touch(src / "a.sln", "a 3")
+    _touch(src / "c.sln", "c")
+    report = convert_directory(src, out)
+    assert sorted(report['converted']) == ["a.sln", "c.sln"]
+    assert json.loads((out / "a.json").read_text()) == [['a', 3]]
+
+    # removed inputs remove their outputs
+    (src / "sub" / "b.sln").unlink()
+    report = convert_directory(src, out)
+    assert report['removed'] == ["sub/b.sln"]
+    assert not (out / "sub").exists()
+
+    # deleted outputs are regenerated
+    (out / "c.json").unlink()
+    report = convert_directory(src, out)
+    assert report['converted'] == ["c.sln"]
+
+def test_convert_directory_failure(tmp_path):
+
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+
+    _touch(src / "a.sln", "a 1")
+    convert_directory(src, out)
+
+    _touch(src / "a.sln", "(a")
+    report = convert_directory(src, out)
+    assert list(report['failed']) == ["a.sln"]
+    # the previous output is kept
+    assert json.loads((out / "a.json").read_text()) == [['a', 1]]
+
+    # an unchanged failing file is not retried, but still reported
+    error = report['failed']["a.sln"]
+    report = convert_directory(src, out)
+    assert report['failed'] == {"a.sln" : error}
+    assert report['unchanged'] == []
+    _touch(src / "a.sln", "(a")
+    assert convert_directory(src, out)['failed'] == {"a.sln" : error}
+
+    _touch(src / "a.sln", "a 2")
+    report = convert_directory(src, out)
+    assert report['converted'] == ["a.sln"]
+
+    # a new file that fails and is then removed
+    _touch(src / "b.sln", "(b")
+    report = convert_directory(src, out)
+    assert list(report['failed']) == ["b.sln"]
+    assert list(convert_directory(src, out)['failed']) == ["b.sln"]
+
+    (src / "b.sln").unlink()
+    report = convert_directory(src, out)
+    assert report['removed'] == ["b.sln"]
+
+def test_convert_directory_manifest_path(tmp_path):
+
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+    manifest = tmp_path / "state" / "nested" / "manifest.json"
+
+    _touch(src / "a.sln", "a 1")
+    report = convert_directory(src, out, manifest_path=manifest)
+    assert report['converted'] == ["a.sln"]
+    assert manifest.exists()
+
+    assert convert_directory(src, out, manifest_path=manifest)['converted'] == []
+
+def test_convert_directory_limits(tmp_path):
+
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+
+    _touch(src / "small.sln", "a 1")
+    _touch(src / "large.sln", "a " * 1000)
+
+    limits = Limits(max_input_bytes=100)
+    report = convert_directory(src, out, limits=limits)
+    assert report['converted'] == ["small.sln"]
+    assert list(report['failed']) == ["large.sln"]
+
+    report = convert_directory(src, out, limits=limits)
+    assert report['converted'] == []
+    assert list(report['failed']) == ["large.sln"]
+
+    # other limits reconvert everything
+    report = convert_directory(src, out)
+    assert report['converted'] == ["large.sln", "small.sln"]
+    assert report['failed'] == {}
+    assert convert_directory(src, out)['converted'] == []
+
+def test_convert_directory_timeout(tmp_path, monkeypatch):
+
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+
+    _touch(src / "a.sln", "a " * 10000)
+
+    parsed = []
+    def counting_parse_to_json(sln_text, limits=None):
+        parsed.append(sln_text)
+        return parse_to_json(sln_text, limits=limits)
+    monkeypatch.setattr(sln.json, "parse_to_json", counting_parse_to_json)
+
+    limits = Limits(timeout=0)
+    report = convert_directory(src, out, limits=limits)
+    assert list(report['failed']) == ["a.sln"]
+    assert "time limit" in report['failed']["a.sln"]
+
+    # a timeout is retried even if nothing changed
+    report = convert_directory(src, out, limits=limits)
+    assert list(report['failed']) == ["a.sln"]
+    assert len(parsed) == 2
+
+def test_convert_directory_vanished(tmp_path, monkeypatch):
+
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+
+    _touch(src / "a.sln", "a 1")
+    _touch(src / "b.sln", "b 1")
+    convert_directory(src, out)
+
+    # b.sln is deleted between listing the directory and reading it
+    file_digest = sln.json._file_digest
+    def vanishing_digest(path):
+        if path.name == "b.sln":
+            path.unlink()
+        return file_digest(path)
+    monkeypatch.setattr(sln.json, "_file_digest", vanishing_digest)
+
+    _touch(src / "a.sln", "a 2")
+    _touch(src / "b.sln", "b 2")
+    report = convert_directory(src, out)
+    assert report['converted'] == ["a.sln"]
+    assert report['removed'] == ["b.sln"]
+    assert not (out / "b.json").exists()
+
+class StopWatching(Exception):
+    pass
+
+def test_watch_directory(tmp_path):
+
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+
+    _touch(src / "a.sln", "a 1")
+
+    reports = []
+    def callback(report):
+        reports.append(report)
+        raise StopWatching()
+
+    with pytest.raises(StopWatching):
+        watch_directory(src, out, interval=0, callback=callback)
+
+    assert len(reports) == 1
+    assert reports[0]['converted'] == ["a.sln"]
+    assert json.loads((out / "a.json").read_text()) == [['a', 1]]
+
+def test_cli_directory(tmp_path, monkeypatch, capsys):
+
+    src = tmp_path / "src"
+    out = tmp_path / "out"
+
+    _touch(src / "bad.sln", "(a")
+
+    def run():
+        monkeypatch.setattr(sys, "argv", ["sln-to-json", str(src), "-o", str(out)])
+        return Cli().run()
+
+    assert run() == 1
+    # a failing file keeps failing the build until it is fixed
+    assert run() == 1
+    assert "failed: bad.sln" in capsys.readouterr().err
+
+    _touch(src / "bad.sln", "(a)")
+    assert run() == 0
+    assert json.loads((out / "bad.json").read_text()) == [['a']]
@@ -1,5 +1,8 @@
 
-from sln import Parser
+import pytest
+
+from sln import Parser, Limits
+from sln.parser import Interner, SLNLimitError
 
 def test_parse_to_string():
 
@@ -71,3 +74,92 @@ list
     for input, expected in cases:
 
         assert Parser(input).parse_to_string() == expected
+
+def test_interner():
+
+    text = """
+package a
+    depends (libfoo "1.0") {debug = 0;}
+package b
+    depends (libfoo "1.0") {debug = 0;}
+values 1 1.0 "1"
+"""
+
+    interner = Interner()
+    tree = Parser(text, interner=interner).parse()
+
+    assert Parser.parsed_to_string(tree) == Parser(text).parse_to_string()
+
+    a_depends = tree[0][2]
+    b_depends = tree[1][2]
+    assert a_depends is b_depends
+
+    # equal values of different types are not merged
+    assert [type(value) for value in tree[2][1:]] == [int, float, str]
+
+    stats = interner.stats()
+    assert stats['shared'] > 0
+    assert stats['unique'] + stats['shared'] == stats['nodes']
+
+    # floats that compare equal but differ are not merged
+    zeros = Parser("a 0.0 -0.0\n(x 0.0)\n(x -0.0)", interner=Interner()).parse()
+    assert [repr(value) for value in zeros[0][1:]] == ['0.0', '-0.0']
+    assert zeros[1] is not zeros[2]
+    assert repr(zeros[2][1]) == '-0.0'
+
+    # sharing an interner deduplicates across documents
+    other = Parser(text, interner=interner).parse()
+    assert other is tree
+
+def test_literals():
+
+    cases = (
+        ("""1:i32 0x10 -0b11 2.5:f32""", [[1, 16, -3, 2.5]]),
+        ('''"a\\\\nb"''', ['a\\nb']),
+        ('''"\\x41B"''', ['AB']),
+    )
+
+    for input, expected in cases:
+
+        assert Parser(input).parse_to_string() == expected
+
+def test_limits():
+
+    cases = (
+        ("(" * 100000 + ")" * 100000, Limits(max_depth=50), 'max_depth'),
+        ("a\n    b\n        c\n            d", Limits(max_depth=3), 'max_depth'),
+        ("a " * 1000, Limits(max_nodes=100), 'max_nodes'),
+        ("(" + ";" * 100000 + ")", Limits(max_nodes=10), 'max_nodes'),
+        ("(a;a;a;a;a;)", Limits(max_nodes=10), 'max_nodes'),
+        ("a;a;a;a;a;a", Limits(max_nodes=10), 'max_nodes'),
+        ("a " + "b" * 1000, Limits(max_atom_length=100), 'max_atom_length'),
+        ('"' + "b" * 1000 + '"', Limits(max_atom_length=100), 'max_atom_length'),
+        ('""""' + "b" * 1000, Limits(max_atom_length=100), 'max_atom_length'),
+        ("a " * 1000, Limits(max_input_bytes=100), 'max_input_bytes'),
+        ("é" * 60, Limits(max_input_bytes=100), 'max_input_bytes'),
+        ("a " * 10000, Limits(timeout=0), 'timeout'),
+        ("#" + "c" * 100000, Limits(timeout=0), 'timeout'),
+        (" " * 100000 + "a", Limits(timeout=0), 'timeout'),
+        ('""""' + "b" * 100000, Limits(timeout=0), 'timeout'),
+    )
+
+    for input, limits, limit in cases:
+
+        with pytest.raises(SLNLimitError) as excinfo:
+            Parser(input, limits=limits).parse()
+
+        assert excinfo.value.limit == limit
+
+    # ten nodes: five atoms, four split lists and the outer list
+    assert Parser("(a;a;a;a;a)", limits=Limits(max_nodes=10)).parse_to_string() == \
+        [[['a'], ['a'], ['a'], ['a'], 'a']]
+
+    limits = Limits(
+        max_depth=4,
+        max_nodes=20,
+        max_atom_length=10,
+        max_input_bytes=100,
+        timeout=10,
+    )
+    assert Parser("list\n    is (one two)", limits=limits).parse_to_string() == \
+        [['list', ['is', ['one', 'two']]]]
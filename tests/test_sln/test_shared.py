@@ -0,0 +1,114 @@
+
+import multiprocessing
+import sys
+from collections.abc import Sequence
+
+import pytest
+
+from sln import Parser, Interner, Converter, dumps
+from sln.diff import diff
+from sln.parser import Symbol, SLNError
+
+shared = pytest.importorskip("sln.shared")
+
+TEXT = """
+package foo
+    version "1.0" 2 -3.5 123456789012345678901234
+    depends (a b) {x = 1;} []
+package bar
+    version "2.0"
+single
+"""
+
+def test_round_trip():
+
+    tree = Parser(TEXT).parse()
+
+    with shared.SharedTree.create(tree) as shared_tree:
+
+        attached = shared.SharedTree.attach(shared_tree.name)
+        root = attached.root
+
+        assert repr(root.to_tuple()) == repr(tree)
+        assert len(root) == 3
+        assert type(root[0]) is shared.SharedList
+        assert root[0][1] is tree[0][1]
+        assert type(root[-1]) is Symbol
+        assert root[0][2][3:] == (-3.5, 123456789012345678901234)
+        assert [len(form) for form in root[:2]] == [4, 3]
+
+        with pytest.raises(IndexError):
+            root[3]
+
+        attached.close()
+
+def test_views_in_other_apis():
+
+    tree = Parser(TEXT).parse()
+
+    with shared.SharedTree.create(tree) as shared_tree:
+
+        attached = shared.SharedTree.attach(shared_tree.name)
+        root = attached.root
+
+        assert root == tree
+        assert tree == root
+        assert root[0] == tree[0]
+        assert root[0] != tree[1]
+        assert isinstance(root, Sequence)
+
+        assert Converter().convert(root) == Converter().convert(tree)
+        assert dumps(root) == dumps(tree)
+        assert dumps(root, style="indent") == dumps(tree, style="indent")
+        assert diff(tree, root) == []
+
+        changed = Parser(TEXT.replace('"2.0"', '"2.1"')).parse()
+        assert [(change.kind, change.path) for change in diff(root, changed)] == \
+            [('changed', (1, 2, 1))]
+
+        attached.close()
+
+def test_shares_interned_subtrees():
+
+    text = "\n".join("(depends (libfoo \"1.0\"))" for _ in range(100))
+
+    plain = shared.SharedTree.create(Parser(text).parse())
+    interned = shared.SharedTree.create(Parser(text, interner=Interner()).parse())
+
+    try:
+        assert len(interned) < len(plain)
+        assert repr(interned.root.to_tuple()) == repr(plain.root.to_tuple())
+    finally:
+        for shared_tree in (plain, interned):
+            shared_tree.close()
+            shared_tree.unlink()
+
+def test_attached_cannot_unlink():
+
+    with shared.SharedTree.create(Parser(TEXT).parse()) as shared_tree:
+
+        attached = shared.SharedTree.attach(shared_tree.name)
+        with pytest.raises(SLNError):
+            attached.unlink()
+        attached.close()
+
+_worker_tree = None
+
+def _init_worker(name):
+    global _worker_tree
+    _worker_tree = shared.SharedTree.attach(name)
+
+def _package_name(index):
+    return _worker_tree.root[index][1].string
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs the fork start method")
+def test_pool():
+
+    tree = Parser(TEXT).parse()
+
+    with shared.SharedTree.create(tree) as shared_tree:
+
+        context = multiprocessing.get_context("fork")
+        with context.Pool(2, initializer=_init_worker,
+                          initargs=(shared_tree.name,)) as pool:
+            assert pool.map(_package_name, [0, 1]) == ["foo", "bar"]
@@ -0,0 +1,53 @@
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sln import Parser
+from sln.parser import symbol
+
+N_THREADS = 8
+
+def test_symbol_identity_concurrent():
+
+    names = ["threaded-symbol-{}".format(i) for i in range(500)]
+    barrier = threading.Barrier(N_THREADS)
+
+    def intern_all(_):
+        barrier.wait()
+        return [symbol(name) for name in names]
+
+    with ThreadPoolExecutor(N_THREADS) as pool:
+        results = list(pool.map(intern_all, range(N_THREADS)))
+
+    for result in results[1:]:
+        for a, b in zip(results[0], result):
+            assert a is b
+
+def test_parse_concurrent():
+
+    texts = [
+        "\n".join(
+            "form{}-{}\n    value {}\n    (nested {} list)".format(i, j, j, i)
+            for j in range(50)
+        )
+        for i in range(N_THREADS * 4)
+    ]
+    expected = [Parser(text).parse_to_string() for text in texts]
+    barrier = threading.Barrier(N_THREADS)
+
+    def parse_all(offset):
+        barrier.wait()
+        results = []
+        for k in range(len(texts)):
+            i = (k + offset) % len(texts)
+            results.append((i, Parser(texts[i]).parse()))
+        return results
+
+    with ThreadPoolExecutor(N_THREADS) as pool:
+        all_results = list(pool.map(parse_all, range(N_THREADS)))
+
+    for results in all_results:
+        for i, tree in results:
+            assert Parser.parsed_to_string(tree) == expected[i]
+            # symbols are shared between all parses
+            assert tree[0][0] is symbol("form{}-0".format(i))
@@ -0,0 +1,108 @@
+
+import io
+
+import pytest
+
+from sln import Parser, dump, dumps
+from sln.parser import SLNError, symbol, unescape_string
+from sln.writer import escape_string
+
+def test_escape_string():
+
+    for text in ("", "plain", "q\"uote", "back\\slash", "a\nb\tc\r", "\x01\x7f", "é"):
+
+        escaped = escape_string(text)
+        assert unescape_string(escaped[1:-1]) == text
+        assert Parser(escaped).parse() == (text,)
+
+def test_dumps():
+
+    tree = Parser("""
+package foo
+    version "1.0"
+    depends (a b) {x = 1;} [1 2.5 -3]
+single
+""").parse()
+
+    assert dumps(tree) == (
+        '(package foo (version "1.0") (depends (a b) {(x = 1)} [1 2.5 -3]))\n'
+        'single\n'
+    )
+
+    assert dumps(tree, style="indent") == (
+        'package foo\n'
+        '    version "1.0"\n'
+        '    depends\n'
+        '        a b\n'
+        '        {(x = 1)}\n'
+        '        [1 2.5 -3]\n'
+        'single\n'
+    )
+
+def test_round_trip():
+
+    cases = (
+        """""",
+        """single""",
+        """(single)""",
+        """()""",
+        """list is "one\\ttwo" 1 -2.5 1e+20 inf""",
+        """1e-5 1.5e-7 -2.5e-300 5e-324 1e16 1.5e300 0.0001""",
+        """'quoted '1 , x""",
+        """
+list
+    is
+        one two
+    (x y) z
+        (w)
+            """,
+        """{a = 1; b = [1 2 {c : 3}];}""",
+    )
+
+    for input in cases:
+
+        tree = Parser(input).parse()
+        for style in ("paren", "indent"):
+            assert repr(Parser(dumps(tree, style=style)).parse()) == repr(tree)
+
+def test_dump_reals():
+
+    reals = (1e-05, 1.5e-07, 0.0001, -2.5e-300, 5e-324,
+             1e16, 1e20, 1.5e300, -0.0, 123.0)
+
+    tree = ((symbol("a"),) + reals,)
+    back = Parser(dumps(tree)).parse()
+
+    assert all(type(value) is float for value in back[0][1:])
+    assert repr(back) == repr(tree)
+
+def test_dump_chunks():
+
+    class Recorder(io.StringIO):
+        writes = 0
+
+        def write(self, text):
+            self.writes += 1
+            return super().write(text)
+
+    tree = tuple((symbol("form"), i, "text") for i in range(1000))
+
+    fp = Recorder()
+    dump(tree, fp, chunk_size=1024)
+
+    assert fp.getvalue() == dumps(tree)
+    assert 1 < fp.writes < 100
+
+def test_dump_errors():
+
+    for name in ("", "has space", "a;b", "a(b", 'x"y', "a#b", "a,b",
+                 "a\\", "1", "inf", "1.5", "-2", "1:i32"):
+
+        with pytest.raises(SLNError):
+            dumps(((symbol("f"), symbol(name)),))
+
+    with pytest.raises(SLNError):
+        dumps((object(),))
+
+    with pytest.raises(ValueError):
+        dumps((), style="unknown")